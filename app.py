@@ -1,77 +1,208 @@
 
 # app.py – Générateur de leads : Google Places + surfaces via Overpass
 
+import asyncio
+import io
+import os
 import time
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+import httpx
+import numpy as np
+import orjson
 import pandas as pd
 import geopandas as gpd
 import googlemaps
 import folium
+import mercantile
+import requests_cache
+from folium.plugins import FastMarkerCluster
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import streamlit as st
 import streamlit.components.v1 as components
-from shapely.geometry import Polygon, Point
-from shapely.ops import unary_union
+import shapely
+from aiolimiter import AsyncLimiter
+from shapely.geometry import Point
+from shapely.prepared import prep
+from shapely.strtree import STRtree
 
 # --- CONSTANTES
 OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+PLACES_V1_URL = "https://places.googleapis.com/v1/places/"
+# FieldMask v1 : la réponse ne contient que ces champs (payloads minimaux).
+PLACES_V1_FIELDMASK = ("displayName,internationalPhoneNumber,websiteUri,"
+                       "googleMapsUri,addressComponents")
+DETAILS_CONCURRENCY = 15   # requêtes Place Details simultanées
+DETAILS_MAX_QPS = 45       # token bucket, juste sous le quota Details (~50 QPS)
 CATEGORY_KEYWORDS = {
     'Entrepôts frigorifiques': 'entrepôt frigorifique',
     'Bornes de recharge': 'station de recharge véhicule électrique',
     'Bureaux': 'bureau',
     'Fonds immobiliers': 'fonds immobilier'
 }
+# Types Google Places plausibles par catégorie, restreints au vocabulaire
+# LEGACY effectivement renvoyé par gmaps.places() : les résultats portant un
+# type spécifique hors liste sont écartés AVANT les appels Details/Overpass.
+# Les résultats sans type spécifique (point_of_interest/establishment seuls,
+# cas fréquent pour bureaux et bornes) sont conservés : absence de signal
+# n'est pas un signal de rejet.
+ALLOWED_TYPES_BY_CATEGORY = {
+    'Entrepôts frigorifiques': {'storage', 'moving_company', 'food'},
+    'Bornes de recharge': {'gas_station', 'parking', 'car_repair'},
+    'Bureaux': {'accounting', 'lawyer', 'real_estate_agency',
+                'insurance_agency', 'finance'},
+    'Fonds immobiliers': {'real_estate_agency', 'finance'}
+}
+GENERIC_PLACE_TYPES = {'point_of_interest', 'establishment'}
+# Gabarit unique des popups de la carte, rendu en une passe avant l'envoi au cluster.
+POPUP_TPL = ("<b>{name}</b><br>{reg} / {dept}<br>{surf} m²<br>"
+             "<a href='{gmap}' target='_blank'>Google Maps</a>")
 LAT_MIN, LAT_MAX, LON_MIN, LON_MAX = 41.0, 51.5, -5.5, 9.5
 STEP_LAT, STEP_LON = 0.5, 0.7
+OVERPASS_TILE_ZOOM = 14  # tuiles ~2,4 km : unité de requête et de cache Overpass
+OVERPASS_CACHE_TTL = 604800  # 7 jours
+OVERPASS_MAX_WORKERS = 4  # POST parallèles (l'endpoint public throttle au-delà)
+FRANCE_BUILDINGS_GPKG = "france_buildings.gpkg"  # snapshot local optionnel
+BUILDING_MATCH_TOL = 0.0005  # ≈50 m en degrés, pour rattacher un bâtiment à un lead
+# Contour simplifié de la France métropolitaine + Corse, embarqué en WKT :
+# aucune dépendance à un jeu de données externe (geopandas.datasets a disparu
+# en 1.0). Précision largement suffisante pour rogner une grille au pas de 0,5°.
+FRANCE_OUTLINE_WKT = (
+    "MULTIPOLYGON ((("
+    "-1.8 43.4, -1.2 46.3, -2.5 47.3, -4.8 48.4, -4.6 48.7, -1.5 48.7, "
+    "-1.9 49.7, 0.2 49.7, 1.6 51.0, 2.5 51.1, 4.2 50.0, 5.5 49.5, 6.6 49.3, "
+    "8.2 49.0, 7.6 47.5, 6.8 47.3, 7.0 45.9, 6.8 45.1, 7.7 44.1, 6.6 43.0, "
+    "4.8 43.3, 3.0 42.4, 1.8 42.3, 0.7 42.7, -1.8 43.4)), "
+    "((8.5 41.3, 9.6 41.4, 9.5 43.1, 8.5 42.9, 8.5 41.3)))")
+
+# Session Overpass avec cache disque (SQLite) : les requêtes identiques,
+# y compris les POST (clé = corps de la requête), ne repartent pas sur le réseau.
+# Keep-alive + pool de connexions : le handshake TCP/TLS est amorti sur tous
+# les POST. 429 (throttling) est re-tenté ICI avec backoff en honorant
+# Retry-After — surtout ne pas relancer plus de requêtes ; 504 (requête trop
+# lourde) n'est PAS re-tenté : il déclenche la descente en tuiles filles
+# dans _fetch_buildings_tile.
+_OVERPASS_SESSION = requests_cache.CachedSession(
+    '.cache/overpass', backend='sqlite',
+    expire_after=OVERPASS_CACHE_TTL, allowable_methods=('GET', 'POST'))
+# gzip est négocié par défaut ; annoncer aussi brotli (paquet `brotli`
+# installé) réduit nettement les octets sur le JSON verbeux d'Overpass.
+_OVERPASS_SESSION.headers.update({'Accept-Encoding': 'gzip, br',
+                                  'User-Agent': 'LeadGen/1.0'})
+_OVERPASS_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=10, pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=2,
+                      status_forcelist=[429, 502, 503],
+                      allowed_methods=['GET', 'POST'],
+                      respect_retry_after_header=True)))
 
 # --- UTILITAIRES
 
+@st.cache_resource
+def _gmaps(key):
+    """Client googlemaps unique par clé API : sa Session requests interne
+    (pool de connexions) est réutilisée sur tous les appels Places."""
+    return googlemaps.Client(key=key, requests_kwargs={'timeout': 30})
+
+@st.cache_resource
+def load_france_shape():
+    """
+    Polygone préparé de la France métropolitaine (contour WKT embarqué),
+    chargé une fois par process. Tamponné de 0,2° pour rester inclusif sur
+    les côtes malgré le contour grossier. Renvoie None si le chargement
+    échoue : la grille n'est alors simplement pas rognée.
+    """
+    try:
+        return prep(shapely.from_wkt(FRANCE_OUTLINE_WKT).buffer(0.2))
+    except Exception:
+        return None
+
+@st.cache_data(show_spinner=False)
 def build_france_grid():
-    """Génère une grille de points couvrant la France."""
-    pts = []
-    lat = LAT_MIN
-    while lat <= LAT_MAX:
-        lon = LON_MIN
-        while lon <= LON_MAX:
-            pts.append((lat, lon))
-            lon += STEP_LON
-        lat += STEP_LAT
-    return pts
+    """
+    Génère une grille de points (lat, lon) couvrant la France — vectorisé numpy,
+    puis rognée au territoire réel : la boîte LAT/LON déborde sur l'Atlantique,
+    la Méditerranée et les pays voisins (~30 % de points inutiles sinon).
+    """
+    # Borne haute décalée d'un demi-pas : inclut LAT_MAX/LON_MAX quelle que
+    # soit la dérive flottante d'arange, sans jamais créer de rang en trop.
+    lats = np.arange(LAT_MIN, LAT_MAX + STEP_LAT / 2, STEP_LAT)
+    lons = np.arange(LON_MIN, LON_MAX + STEP_LON / 2, STEP_LON)
+    la, lo = np.meshgrid(lats, lons, indexing='ij')
+    grid = np.column_stack([la.ravel(), lo.ravel()])
+    france = load_france_shape()
+    if france is None:
+        return grid
+    keep = np.fromiter((france.contains(Point(lon, lat)) for lat, lon in grid),
+                       dtype=bool, count=len(grid))
+    return grid[keep]
 
 def estimate_api_calls(grid_pts):
     """Estime le nombre d'appels API (1 text search + 1 detail par point)."""
     return len(grid_pts) * 2
 
-def get_building_polygon(lat, lon, radius=50):
-    """Récupère les polygones OSM 'building' autour d'un point via Overpass."""
-    q = f"""
-    [out:json][timeout:25];
-    way(around:{radius},{lat},{lon})[building];
-    out body geom;
+def _parse_buildings(el):
+    """Éléments Overpass → polygones, construits en bloc (shapely 2)."""
+    rings = [np.array([(pt['lon'], pt['lat']) for pt in e['geometry']])
+             for e in el
+             if e['type']=='way' and len(e.get('geometry', [])) >= 3]
+    if not rings:
+        return []
+    flat = np.concatenate(rings)
+    idx = np.repeat(np.arange(len(rings)), [len(r) for r in rings])
+    ps = shapely.polygons(shapely.linearrings(flat, indices=idx))
+    keep = shapely.is_valid(ps) & (shapely.area(ps) > 0)
+    # Simplification ~0.1 m : le coût de l'union croît avec le nombre de
+    # sommets, la surface estimée ne bouge pas à cette tolérance.
+    return list(shapely.simplify(ps[keep], 1e-6))
+
+def _fetch_buildings_tile(tile):
+    """Bâtiments d'une tuile (bbox WGS84). Si la requête est trop lourde (504),
+    descend d'un niveau de zoom et réessaie sur les quatre tuiles filles ;
+    le throttling (429) est géré par le Retry de la session, avec backoff."""
+    w, s, e, n = mercantile.bounds(tile)
+    q = f"[out:json][timeout:180];way({s},{w},{n},{e})[building];out body geom;"
+    resp = _OVERPASS_SESSION.post(OVERPASS_URL, data={'data': q}, timeout=200)
+    if resp.status_code == 504 and tile.z < 16:
+        return [p for child in mercantile.children(tile)
+                for p in _fetch_buildings_tile(child)]
+    resp.raise_for_status()
+    return _parse_buildings(orjson.loads(resp.content).get('elements', []))
+
+@st.cache_data(ttl=86400, show_spinner=False)
+def fetch_building_polygons(coords):
     """
-    el = requests.post(OVERPASS_URL, data={'data': q}).json().get('elements', [])
+    Récupère les polygones OSM 'building' autour d'une liste de points (lat, lon).
+    Les points sont regroupés par tuile z14 (avec une marge de ~100 m pour les
+    points en bord de tuile) et chaque tuile part en une seule requête bbox :
+    les recherches suivantes dans la même zone retombent sur les mêmes tuiles,
+    donc sur le cache (st.cache_data en rerun, SQLite entre sessions).
+    Les tuiles partent en parallèle (pool de threads, charge I/O-bound).
+    """
+    tiles = set()
+    for lat, lon in coords:
+        tiles.update(mercantile.tiles(lon - 0.001, lat - 0.001,
+                                      lon + 0.001, lat + 0.001,
+                                      OVERPASS_TILE_ZOOM))
     polys = []
-    for e in el:
-        if e['type']=='way' and 'geometry' in e:
-            coords = [(pt['lon'], pt['lat']) for pt in e['geometry']]
-            try:
-                p = Polygon(coords)
-                if p.is_valid and p.area > 0:
-                    polys.append(p)
-            except:
-                pass
-    return unary_union(polys) if polys else None
-
-def calculate_surface_m2(poly):
-    """Approxime la surface en m² d'un shapely Polygon (1°≈111km)."""
-    return poly.area * (111000**2)
-
-def search_places_text(keyword, api_key, region=None, department=None):
+    with ThreadPoolExecutor(max_workers=OVERPASS_MAX_WORKERS) as pool:
+        for tile_polys in pool.map(_fetch_buildings_tile, sorted(tiles)):
+            polys.extend(tile_polys)
+    return polys
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def search_places_text(keyword, _api_key, region=None, department=None):
     """
-    Recherche textuelle Google Places.
+    Recherche textuelle Google Places ; renvoie une liste de dicts (un par
+    résultat), le DataFrame unique étant assemblé par l'appelant après la
+    collecte de tous les périmètres (évite un concat de N petits frames).
     Si department spécifié, on ajoute 'in {department}', sinon si region : 'in {region}', sinon 'in France'.
     Paginate pour récupérer jusqu'à ≈60 résultats.
+    Mise en cache Streamlit par (keyword, region, department) ; la clé API
+    (préfixe _) n'entre pas dans la clé de cache.
     """
-    gmaps = googlemaps.Client(key=api_key)
+    gmaps = _gmaps(_api_key)
     query = keyword
     if department:
         query += f" in {department}"
@@ -82,8 +213,19 @@ def search_places_text(keyword, api_key, region=None, department=None):
     resp = gmaps.places(query=query, language='fr')
     results = resp.get('results', [])
     while 'next_page_token' in resp:
-        time.sleep(2)
-        resp = gmaps.places(query=query, language='fr', page_token=resp['next_page_token'])
+        # Le token devient actif en ~2 s mais souvent moins : sondage en
+        # backoff exponentiel (0.5 → 1 → 2 s) plutôt qu'une attente fixe.
+        token = resp['next_page_token']
+        delay = 0.5
+        while True:
+            time.sleep(delay)
+            try:
+                resp = gmaps.places(query=query, language='fr', page_token=token)
+                break
+            except googlemaps.exceptions.ApiError:
+                if delay >= 2:
+                    raise
+                delay *= 2
         results += resp.get('results', [])
     rows = []
     for p in results:
@@ -91,66 +233,166 @@ def search_places_text(keyword, api_key, region=None, department=None):
         rows.append({
             'place_id': p['place_id'],
             'latitude': loc['lat'],
-            'longitude': loc['lng']
+            'longitude': loc['lng'],
+            'name': p.get('name'),
+            'formatted_address': p.get('formatted_address'),
+            'types': tuple(p.get('types', []))
         })
-    return pd.DataFrame(rows).drop_duplicates('place_id')
+    return rows
+
+async def fetch_detail(client, limiter, sem, place_id):
+    """Récupère un Place Details v1 via httpx (borné par sémaphore + limiteur QPS)."""
+    async with sem, limiter:
+        resp = await client.get(PLACES_V1_URL + place_id,
+                                params={'languageCode': 'fr'})
+        resp.raise_for_status()
+        return resp.json()
 
-def enrich_place_details(df, api_key):
+async def _gather_details(place_ids, api_key):
     """
-    Pour chaque place_id, appelle Google Place Details (sans fields)
-    puis extrait nom, téléphone, website, lien Google Maps, PagesJaunes,
-    et administrative_area_level_1 & 2 pour région & département.
+    Lance tous les Place Details en concurrence bornée et rassemble les
+    résultats. Connexion HTTP/2 unique (streams multiplexés) et FieldMask v1 :
+    un seul handshake TLS et des réponses réduites aux champs utiles.
     """
-    gmaps = googlemaps.Client(key=api_key)
+    sem = asyncio.Semaphore(DETAILS_CONCURRENCY)
+    limiter = AsyncLimiter(DETAILS_MAX_QPS, 1)
+    headers = {'X-Goog-Api-Key': api_key, 'X-Goog-FieldMask': PLACES_V1_FIELDMASK}
+    async with httpx.AsyncClient(http2=True, timeout=30, headers=headers) as client:
+        tasks = [fetch_detail(client, limiter, sem, pid) for pid in place_ids]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+@st.cache_data(ttl=86400, show_spinner=False)
+def enrich_place_details(df, _api_key):
+    """
+    Complète chaque lead via Google Place Details : téléphone, website, lien
+    Google Maps, PagesJaunes, et administrative_area_level_1 & 2 pour
+    région & département. Les champs déjà ramenés par la recherche textuelle
+    (nom, adresse) sont repris tels quels, et les lignes déjà complètes
+    (téléphone + website réellement renseignés, le sentinel 'Non dispo'
+    comptant comme manquant) ne déclenchent aucun appel Details.
+    Les appels partent en concurrence (asyncio + httpx) au lieu d'une boucle
+    séquentielle avec time.sleep(1) : le coût total ≈ N / concurrence.
+    """
+    if 'contact_phone' in df.columns and 'contact_website' in df.columns:
+        have_phone = df['contact_phone'].notna() & (df['contact_phone'] != 'Non dispo')
+        have_web = df['contact_website'].notna() & (df['contact_website'] != 'Non dispo')
+        need = ~(have_phone & have_web)
+    else:
+        need = pd.Series(True, index=df.index)
+    pids = df.loc[need, 'place_id'].tolist()
+    details = dict(zip(pids, asyncio.run(_gather_details(pids, _api_key))))
     out = []
-    for _, r in df.iterrows():
-        try:
-            detail = gmaps.place(place_id=r['place_id']).get('result', {})
-        except Exception as e:
-            st.error(f"Erreur Place Details ({r['place_id']}): {e}")
+    out_cols = ('place_id', 'latitude', 'longitude', 'contact_name',
+                'contact_phone', 'contact_website', 'google_maps_link',
+                'region', 'department')
+    for row in df.to_dict('records'):
+        pid = row['place_id']
+        if pid not in details:
+            # Déjà enrichi, aucun appel : reprojeté sur le schéma de sortie
+            # pour ne pas traîner les colonnes brutes de la recherche.
+            out.append({k: row.get(k) for k in out_cols})
+            continue
+        detail = details[pid]
+        if isinstance(detail, Exception):
+            st.error(f"Erreur Place Details ({pid}): {detail}")
             continue
         region = None
         department = None
-        for comp in detail.get('address_components', []):
+        for comp in detail.get('addressComponents', []):
             types = comp.get('types', [])
             if 'administrative_area_level_1' in types:
-                region = comp.get('long_name')
+                region = comp.get('longText')
             if 'administrative_area_level_2' in types:
-                department = comp.get('long_name')
-        name = detail.get('name', 'Non dispo')
-        pj = f"https://www.pagesjaunes.fr/recherche/{name.replace(' ', '%20')}"
+                department = comp.get('longText')
+        name = ((detail.get('displayName') or {}).get('text')
+                or row.get('name') or 'Non dispo')
         out.append({
-            'place_id': r['place_id'],
-            'latitude': r['latitude'],
-            'longitude': r['longitude'],
+            'place_id': pid,
+            'latitude': row['latitude'],
+            'longitude': row['longitude'],
             'contact_name': name,
-            'contact_phone': detail.get('international_phone_number','Non dispo'),
-            'contact_website': detail.get('website','Non dispo'),
-            'google_maps_link': detail.get('url','Non dispo'),
-            'pagesjaunes_link': pj,
+            'contact_phone': detail.get('internationalPhoneNumber','Non dispo'),
+            'contact_website': detail.get('websiteUri','Non dispo'),
+            'google_maps_link': detail.get('googleMapsUri','Non dispo'),
             'region': region,
             'department': department
         })
-        time.sleep(1)
-    return pd.DataFrame(out)
+    out_df = pd.DataFrame(out)
+    if len(out_df):
+        # Lien PagesJaunes en une passe vectorisée, avec un vrai échappement
+        # URL (l'ancien replace(' ', '%20') laissait passer &, / et accents).
+        out_df['pagesjaunes_link'] = ('https://www.pagesjaunes.fr/recherche/'
+                                      + out_df['contact_name'].map(quote))
+    return out_df
+
+def build_france_buildings_cache(path=FRANCE_BUILDINGS_GPKG):
+    """
+    Bootstrap hors application : télécharge une fois les emprises 'building'
+    de la France via osmnx et les persiste en GeoPackage. À lancer depuis un
+    shell : python -c "import app; app.build_france_buildings_cache()".
+    osmnx n'est requis que pour cette étape, pas au runtime de l'app.
+    """
+    import osmnx as ox
+    gdf_b = ox.features_from_place('France', tags={'building': True})
+    gdf_b = gdf_b[gdf_b.geometry.geom_type.isin(['Polygon', 'MultiPolygon'])]
+    gdf_b[['geometry']].to_file(path, driver='GPKG')
+    return path
+
+@st.cache_resource
+def load_france_buildings(path=FRANCE_BUILDINGS_GPKG):
+    """Charge le snapshot local des bâtiments s'il existe."""
+    if not os.path.exists(path):
+        return None
+    return gpd.read_file(path)
+
+@st.cache_resource
+def load_buildings_tree(path=FRANCE_BUILDINGS_GPKG):
+    """STRtree packé (shapely 2) construit une fois sur le snapshot local."""
+    gdf_b = load_france_buildings(path)
+    if gdf_b is None:
+        return None
+    return STRtree(gdf_b.geometry.values)
 
 def attach_surfaces(df, min_area):
     """
-    Pour chaque ligne enrichie, récupère le polygone bâtiment via Overpass,
-    calcule la surface et filtre selon min_area.
+    Récupère les bâtiments autour de toutes les lignes enrichies — depuis le
+    snapshot local s'il est présent, sinon en requêtes Overpass groupées —
+    rattache à chaque lead les polygones proches, calcule les
+    surfaces en une passe vectorisée (reprojection EPSG:2154 Lambert-93,
+    métrique et précise sur la France) et filtre selon min_area.
     """
-    recs = []
-    for _, r in df.iterrows():
-        poly = get_building_polygon(r['latitude'], r['longitude'])
-        surf = calculate_surface_m2(poly) if poly else 0
-        if surf >= min_area:
-            d = r.to_dict()
-            d.update({'surface_m2': surf,
-                      'geometry': poly or Point(r['longitude'], r['latitude'])})
-            recs.append(d)
+    pts_arr = shapely.points(df['longitude'].to_numpy(), df['latitude'].to_numpy())
+    tree_b = load_buildings_tree()
+    if tree_b is not None:
+        # Snapshot local : une requête STRtree en bloc, zéro trafic Overpass.
+        hits = tree_b.query(pts_arr, predicate='dwithin', distance=BUILDING_MATCH_TOL)
+        all_polys = list(tree_b.geometries.take(np.unique(hits[1])))
+    else:
+        # Déduplication des points à ~11 m près : des leads voisins (même bâtiment)
+        # ne déclenchent qu'une seule clause Overpass, le STRtree rebroadcast ensuite.
+        keys = [(round(la, 4), round(lo, 4))
+                for la, lo in zip(df['latitude'].to_numpy(), df['longitude'].to_numpy())]
+        all_polys = fetch_building_polygons(list(dict.fromkeys(keys)))
+    # Affectation lead→bâtiments en UNE requête STRtree vectorisée sur tous
+    # les points, puis union par groupe — plus de boucle requête-par-lead.
+    recs = df.to_dict('records')
+    if all_polys:
+        polys_arr = np.array(all_polys, dtype=object)
+        tree = STRtree(all_polys)
+        lead_idx, poly_idx = tree.query(pts_arr, predicate='dwithin',
+                                        distance=BUILDING_MATCH_TOL)
+        groups = {}
+        for li, pi in zip(lead_idx, poly_idx):
+            groups.setdefault(li, []).append(pi)
+        for li, pis in groups.items():
+            recs[li]['geometry'] = shapely.union_all(polys_arr.take(pis))
+    for d, pt in zip(recs, pts_arr):
+        d.setdefault('geometry', pt)
     if not recs:
         return gpd.GeoDataFrame(columns=list(df.columns)+['surface_m2','geometry'])
-    return gpd.GeoDataFrame(recs, geometry='geometry', crs='EPSG:4326')
+    gdf = gpd.GeoDataFrame(recs, geometry='geometry', crs='EPSG:4326')
+    gdf['surface_m2'] = gdf.to_crs(2154).area
+    return gdf[gdf['surface_m2'] >= min_area]
 
 # --- STREAMLIT APP
 
@@ -201,22 +443,47 @@ def main():
     st.sidebar.write(f"Appels estimés ≈ {calls}")
 
     if st.sidebar.button("Rechercher"):
-        # Recherche Google Places selon filtres géo
-        frames = []
+        # Recherche Google Places selon filtres géo — les départements/régions
+        # partent en parallèle : temps total ≈ la recherche la plus lente.
+        api_key = st.secrets["GOOGLE_API_KEY"]
         if dept_filter:
-            for d in dept_filter:
-                frames.append(search_places_text(keyword, st.secrets["GOOGLE_API_KEY"],
-                                                 department=d))
+            with ThreadPoolExecutor(max_workers=16) as pool:
+                row_lists = list(pool.map(
+                    lambda d: search_places_text(keyword, api_key, department=d),
+                    dept_filter))
         elif region_filter:
-            for r in region_filter:
-                frames.append(search_places_text(keyword, st.secrets["GOOGLE_API_KEY"],
-                                                 region=r))
+            with ThreadPoolExecutor(max_workers=16) as pool:
+                row_lists = list(pool.map(
+                    lambda r: search_places_text(keyword, api_key, region=r),
+                    region_filter))
         else:
-            frames.append(search_places_text(keyword, st.secrets["GOOGLE_API_KEY"]))
-        df_pl = pd.concat(frames, ignore_index=True).drop_duplicates("place_id")
+            row_lists = [search_places_text(keyword, api_key)]
+        rows = [r for rl in row_lists for r in rl]
+        if not rows:
+            st.warning("Aucun résultat Google Places pour ces critères.")
+            return
+        df_pl = pd.DataFrame(rows).drop_duplicates("place_id")
+
+        # Pré-filtre sur les types Places : évite Details + Overpass pour les
+        # résultats manifestement hors sujet (DAB, agences, etc.). Un résultat
+        # n'est écarté que s'il porte un type spécifique ET qu'aucun n'est admis.
+        allowed = ALLOWED_TYPES_BY_CATEGORY.get(choice)
+        if allowed and 'types' in df_pl.columns:
+            def _types_ok(t):
+                specific = set(t or ()) - GENERIC_PLACE_TYPES
+                return not specific or bool(specific & allowed)
+            mask = np.fromiter((_types_ok(t) for t in df_pl['types'].to_numpy()),
+                               dtype=bool, count=len(df_pl))
+            df_pl = df_pl[mask]
+        if df_pl.empty:
+            st.warning("Tous les résultats ont été écartés par le filtre de types.")
+            return
 
         # Enrichissement détails
         df_det = enrich_place_details(df_pl, st.secrets["GOOGLE_API_KEY"])
+        if df_det.empty:
+            st.warning("Aucun lead n'a pu être enrichi (erreurs Place Details).")
+            return
 
         # Surfaces & filtrage
         gdf = attach_surfaces(df_det, min_area)
@@ -224,30 +491,38 @@ def main():
         st.success(f"{len(gdf)} leads trouvés")
         st.dataframe(gdf[['region','department','surface_m2','contact_name','contact_phone']])
 
-        # Carte Folium
+        # Carte Folium : un seul FastMarkerCluster, les marqueurs et popups
+        # sont générés côté client (HTML en O(1) au lieu d'une balise par lead).
         m = folium.Map(location=[46.6,2.5], zoom_start=6, tiles="cartodbpositron")
-        for _, r in gdf.iterrows():
-            geom = r.geometry.centroid if isinstance(r.geometry, Polygon) else r.geometry
-            popup = folium.Popup(
-                f"<b>{r.contact_name}</b><br>"
-                f"{r.region or '–'} / {r.department or '–'}<br>"
-                f"{int(r.surface_m2)} m²<br>"
-                f"<a href='{r.google_maps_link}' target='_blank'>Google Maps</a>",
-                max_width=300
-            )
-            folium.Marker([geom.y,geom.x], popup=popup).add_to(m)
+        pts = gdf.geometry.representative_point()  # vectorisé, Points et Polygons
+        popups = [POPUP_TPL.format(name=name, reg=reg or '–', dept=dept or '–',
+                                   surf=int(surf), gmap=link)
+                  for name, reg, dept, surf, link in zip(
+                      gdf['contact_name'], gdf['region'], gdf['department'],
+                      gdf['surface_m2'], gdf['google_maps_link'])]
+        data = [[y, x, html]
+                for y, x, html in zip(pts.y.to_numpy(), pts.x.to_numpy(), popups)]
+        callback = """
+        function (row) {
+            var marker = L.marker(new L.LatLng(row[0], row[1]));
+            marker.bindPopup(row[2], {maxWidth: 300});
+            return marker;
+        };
+        """
+        FastMarkerCluster(data, callback=callback).add_to(m)
         components.html(m._repr_html_(), height=500)
 
         # Export CSV
-        df_e = gdf.copy()
-        df_e['wkt'] = df_e.geometry.apply(lambda g: g.wkt)
+        df_e = gdf.assign(wkt=shapely.to_wkt(gdf.geometry.values))
         cols = [
             'region','department','latitude','longitude','surface_m2',
             'contact_name','contact_phone','contact_website','google_maps_link','wkt'
         ]
+        buf = io.BytesIO()
+        df_e[cols].to_csv(buf, index=False)
         st.download_button(
             "📥 Télécharger CSV",
-            data=df_e[cols].to_csv(index=False),
+            data=buf.getvalue(),
             file_name="leads.csv",
             mime="text/csv"
         )